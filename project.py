@@ -1,7 +1,40 @@
 import flet as ft  # Import the necessary GUI components from flet
+import hashlib
+import threading
+from collections import OrderedDict
+from io import StringIO
+import numpy as np
+from numba import njit
 from ortools.constraint_solver import routing_enums_pb2
 from ortools.constraint_solver import pywrapcp
 
+# Error messages for the non-zero codes returned by validate_edges
+EDGES_ERRORS = {
+    1: "The diagonal elements of the edges matrix must be zero.",
+    2: "The non-diagonal elements of the edges matrix must be non-zero.",
+    3: "The edges matrix must be symmetric.",
+}
+
+# Recently solved problems, keyed by their inputs, so re-solving an unchanged problem is instant
+SOLUTION_CACHE_SIZE = 8
+solution_cache = OrderedDict()
+solution_cache_lock = threading.Lock()
+
+# Function to check the edges matrix in one compiled pass over the diagonal and upper triangle
+@njit(cache=True)
+def validate_edges(edges):
+    n = edges.shape[0]
+    for i in range(n):
+        if edges[i, i] != 0:
+            return 1
+        for j in range(i + 1, n):
+            value = edges[i, j]
+            if value == 0:
+                return 2
+            if value != edges[j, i]:
+                return 3
+    return 0
+
 # Function to parse input and validate data integrity
 def parse_input(num_customers_str, vehicle_capacity_str, customer_demands_str, edges_str):
     try:
@@ -10,33 +43,26 @@ def parse_input(num_customers_str, vehicle_capacity_str, customer_demands_str, e
         vehicle_capacity = int(vehicle_capacity_str)
         customer_demands = list(map(int, customer_demands_str.split(',')))
 
+        # Check that vehicles can carry something
+        if vehicle_capacity <= 0:
+            raise ValueError("The vehicle capacity must be positive.")
+
         # Check if the number of customer demands matches num_customers
         if len(customer_demands) != num_customers:
             raise ValueError("The length of customer demands must be equal to the number of customers.")
         
-        edges = []
-        # Parse the edges string to form a matrix
-        for line in edges_str.split(';'):
-            row = list(map(int, line.split(',')))
-            edges.append(row)
+        # Parse the edges string straight into an int32 matrix, one row per semicolon-separated
+        # line; values that do not fit in 32 bits are rejected by the parser
+        edges = np.loadtxt(StringIO(edges_str.replace(';', '\n')), delimiter=',', dtype=np.int32, ndmin=2)
         
         # Validate the edges matrix properties
-        if len(edges) != num_customers + 1:
+        if edges.shape != (num_customers + 1, num_customers + 1):
             raise ValueError("The edges matrix must be a square matrix of size (num_customers + 1) x (num_customers + 1).")
         
-        for row in edges:
-            if len(row) != len(edges):
-                raise ValueError("The edges matrix must be a square matrix of size (num_customers + 1) x (num_customers + 1).")
-        
-        # Check symmetry and diagonal conditions for the edges matrix
-        for i in range(len(edges)):
-            for j in range(len(edges)):
-                if edges[i][j] != edges[j][i]:
-                    raise ValueError("The edges matrix must be symmetric.")
-                if i == j and edges[i][j] != 0:
-                    raise ValueError("The diagonal elements of the edges matrix must be zero.")
-                if i != j and edges[i][j] == 0:
-                    raise ValueError("The non-diagonal elements of the edges matrix must be non-zero.")
+        # Check symmetry and diagonal conditions in compiled code
+        error_code = validate_edges(edges)
+        if error_code:
+            raise ValueError(EDGES_ERRORS[error_code])
         
         # Return validated input data
         return num_customers, vehicle_capacity, customer_demands, edges
@@ -44,13 +70,37 @@ def parse_input(num_customers_str, vehicle_capacity_str, customer_demands_str, e
         # Raise an error with a clear message if input validation fails
         raise ValueError(f"Invalid input: {str(ex)}")
 
+# Function to parse and validate the solver time limit
+def parse_time_limit(time_limit_str):
+    try:
+        time_limit = int(time_limit_str)
+        if time_limit <= 0:
+            raise ValueError("The time limit must be a positive number of seconds.")
+        return time_limit
+    except ValueError as ex:
+        raise ValueError(f"Invalid input: {str(ex)}")
+
+# Function to count the vehicles a first-fit-decreasing packing of the demands uses
+def count_vehicles_needed(customer_demands, vehicle_capacity):
+    remaining_capacities = []
+    for demand in sorted(customer_demands, reverse=True):
+        for i, remaining in enumerate(remaining_capacities):
+            if demand <= remaining:
+                remaining_capacities[i] -= demand
+                break
+        else:
+            remaining_capacities.append(vehicle_capacity - demand)
+    return len(remaining_capacities)
+
 # Function to create the data model for ORTools
 def create_data_model(num_customers, vehicle_capacity, customer_demands, edges):
     data = {}
-    data['distance_matrix'] = edges
+    data['distance_matrix'] = np.asarray(edges, dtype=np.int32).tolist()  # OR-Tools expects plain Python ints
     data['demands'] = [0] + customer_demands  # Include depot demand as 0
-    data['vehicle_capacities'] = [vehicle_capacity] * num_customers  # All vehicles have same capacity
-    data['num_vehicles'] = num_customers  # Number of vehicles equals number of customers
+    # Start from the vehicles a first-fit-decreasing packing of the demands needs and add a
+    # little slack so the search has room to find a plan, never more than one vehicle per customer
+    data['num_vehicles'] = min(num_customers, count_vehicles_needed(customer_demands, vehicle_capacity) + 2)
+    data['vehicle_capacities'] = [vehicle_capacity] * data['num_vehicles']  # All vehicles have same capacity
     data['depot'] = 0  # Starting and ending point (depot) is index 0
     
     # Validate that demands array length matches num_customers + 1
@@ -60,84 +110,99 @@ def create_data_model(num_customers, vehicle_capacity, customer_demands, edges):
 
 # Function to print the solution obtained from ORTools
 def print_solution(data, manager, routing, solution):
-    total_distance = 0
-    total_load = 0
-    result_text = ""
+    routes = []  # Routes of the vehicles that visit at least one customer
 
-    trip_number = 1
+    # Bind frequently used lookups to locals before the route loops
+    demands = data['demands']
+    index_to_node = manager.IndexToNode
+    get_arc_cost = routing.GetArcCostForVehicle
+    is_end = routing.IsEnd
+    next_var = routing.NextVar
+    value = solution.Value
 
     # Iterate over each vehicle's route in the solution
     for vehicle_id in range(data['num_vehicles']):
         index = routing.Start(vehicle_id)
+
+        # Skip vehicles that go straight from the depot back to the depot
+        if is_end(value(next_var(index))):
+            continue
+
         route_distance = 0
         route_load = 0
         route = []
         previous_index = index
         
         # Traverse each node in the vehicle's route
-        while not routing.IsEnd(index):
-            node_index = manager.IndexToNode(index)
-            route_load += data['demands'][node_index]
-            route_distance += routing.GetArcCostForVehicle(previous_index, index, vehicle_id)
+        while not is_end(index):
+            node_index = index_to_node(index)
+            route_load += demands[node_index]
+            route_distance += get_arc_cost(previous_index, index, vehicle_id)
             route.append((node_index, route_load, route_distance))
             previous_index = index
-            index = solution.Value(routing.NextVar(index))
+            index = value(next_var(index))
         
         # Include returning to depot in the route
-        node_index = manager.IndexToNode(index)
-        route_load += data['demands'][node_index]
-        route_distance += routing.GetArcCostForVehicle(previous_index, index, vehicle_id)
+        node_index = index_to_node(index)
+        route_load += demands[node_index]
+        route_distance += get_arc_cost(previous_index, index, vehicle_id)
         route.append((node_index, route_load, route_distance))
+        routes.append(route)
 
-        # Only print routes that visit at least one customer (route length > 2 means it visits at least two nodes)
-        if len(route) > 2:
-            plan_output = f'Route for trip {trip_number}:\n'
-            trip_number += 1
-            for i, (node, load, distance) in enumerate(route[:-1]):
-                if i == 0:
-                    plan_output += f' {node} Load({load}) Distance(0) ->'
-                else:
-                    plan_output += f' {node} Load({load}) Distance({distance}) ->'
-            plan_output += f' {manager.IndexToNode(index)} Load({route[-1][1]}) Distance({route[-1][2]})\n'
-            plan_output += f'Distance of the route: {route[-1][2]}m\n'
-            plan_output += f'Load of the route: {route[-1][1]}\n\n'
-            result_text += plan_output
-        
-        # Accumulate total distance and load for all routes
-        total_distance += route[-1][2] if route else 0
-        total_load += route[-1][1] if route else 0
+    # Total distance and load for all routes are the last entries of each route
+    total_distance = sum(route[-1][2] for route in routes)
+    total_load = sum(route[-1][1] for route in routes)
 
-    # Append total distance and load to result_text
-    result_text += f'\nTotal distance of all routes: {total_distance}m\n'
-    result_text += f'Total load of all routes: {total_load}'
-    return result_text
+    result_parts = []
+    for trip_number, route in enumerate(routes, start=1):
+        route_parts = [f'Route for trip {trip_number}:\n']
+        for i, (node, load, distance) in enumerate(route[:-1]):
+            if i == 0:
+                route_parts.append(f' {node} Load({load}) Distance(0) ->')
+            else:
+                route_parts.append(f' {node} Load({load}) Distance({distance}) ->')
+        route_parts.append(f' {route[-1][0]} Load({route[-1][1]}) Distance({route[-1][2]})\n')
+        route_parts.append(f'Distance of the route: {route[-1][2]}m\n')
+        route_parts.append(f'Load of the route: {route[-1][1]}\n\n')
+        result_parts.append(''.join(route_parts))
+
+    # Append total distance and load and join the parts into the result text
+    result_parts.append(f'\nTotal distance of all routes: {total_distance}m\n')
+    result_parts.append(f'Total load of all routes: {total_load}')
+    return ''.join(result_parts)
 
 # Function to solve the routing problem using ORTools
-def solve_routing_problem(num_customers, vehicle_capacity, customer_demands, edges):
+def solve_routing_problem(num_customers, vehicle_capacity, customer_demands, edges, time_limit=5):
+    # Return the cached result if this exact problem was solved recently
+    edges_key = hashlib.blake2b(np.ascontiguousarray(edges).tobytes(), digest_size=16).digest()
+    cache_key = (edges_key, num_customers, vehicle_capacity, tuple(customer_demands), time_limit)
+    with solution_cache_lock:
+        if cache_key in solution_cache:
+            solution_cache.move_to_end(cache_key)
+            return solution_cache[cache_key]
+
     # Create the data model for ORTools
     data = create_data_model(num_customers, vehicle_capacity, customer_demands, edges)
 
     # Initialize routing index manager and routing model
-    manager = pywrapcp.RoutingIndexManager(len(data['distance_matrix']), data['num_vehicles'], data['depot'])
-    routing = pywrapcp.RoutingModel(manager)
+    num_nodes = len(data['distance_matrix'])
+    manager = pywrapcp.RoutingIndexManager(num_nodes, data['num_vehicles'], data['depot'])
 
-    # Define distance callback function
-    def distance_callback(from_index, to_index):
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        return data['distance_matrix'][from_node][to_node]
+    # Keep the solver's compact table representation for the model's constraints
+    model_parameters = pywrapcp.DefaultRoutingModelParameters()
+    model_parameters.solver_parameters.use_small_table = True
 
-    # Register distance callback
-    transit_callback_index = routing.RegisterTransitCallback(distance_callback)
-    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+    # All vehicles are identical (one arc cost evaluator, same capacity), so let the model
+    # collapse them into a single cost class instead of treating each vehicle separately
+    model_parameters.reduce_vehicle_cost_model = True
+    routing = pywrapcp.RoutingModel(manager, model_parameters)
 
-    # Define demand callback function
-    def demand_callback(from_index):
-        from_node = manager.IndexToNode(from_index)
-        return data['demands'][from_node]
+    # Register the distance matrix so arc costs are looked up in C++ without Python callbacks
+    transit_callback_index = routing.RegisterTransitMatrix(data['distance_matrix'])
+    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
 
-    # Register demand callback
-    demand_callback_index = routing.RegisterUnaryTransitCallback(demand_callback)
+    # Register the demands vector for the capacity dimension
+    demand_callback_index = routing.RegisterUnaryTransitVector(data['demands'])
     routing.AddDimensionWithVehicleCapacity(
         demand_callback_index,
         0,
@@ -145,18 +210,30 @@ def solve_routing_problem(num_customers, vehicle_capacity, customer_demands, edg
         True,
         'Capacity')
 
-    # Set search parameters
+    # Set search parameters: build a first solution by insertion, then improve it with
+    # guided local search until the time limit (in seconds) is reached
     search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-    search_parameters.first_solution_strategy = (routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
+    search_parameters.first_solution_strategy = (routing_enums_pb2.FirstSolutionStrategy.PARALLEL_CHEAPEST_INSERTION)
+    search_parameters.local_search_metaheuristic = (routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH)
+    search_parameters.time_limit.seconds = time_limit
+
+    # Capacity alone needs only light propagation, and search logging is never shown
+    search_parameters.use_full_propagation = False
+    search_parameters.log_search = False
 
     # Solve the problem using ORTools
     solution = routing.SolveWithParameters(search_parameters)
 
-    # Generate and return the solution text
-    if solution:
-        result_text = print_solution(data, manager, routing, solution)
-    else:
-        result_text = "No solution found."
+    # Generate and return the solution text; failures are not cached so solving again retries
+    if not solution:
+        return "No solution found."
+    result_text = print_solution(data, manager, routing, solution)
+
+    # Remember the result, evicting the least recently used entry when the cache is full
+    with solution_cache_lock:
+        solution_cache[cache_key] = result_text
+        if len(solution_cache) > SOLUTION_CACHE_SIZE:
+            solution_cache.popitem(last=False)
 
     return result_text
 
@@ -171,6 +248,7 @@ def main(page: ft.Page):
     vehicle_capacity = ft.TextField(label="Vehicle Capacity", width=200)
     customer_demands = ft.TextField(label="Customer Demands (comma separated)", width=200)
     edges = ft.TextField(label="Edges (semicolon and comma separated)", width=200, max_lines=10, multiline=True)
+    time_limit = ft.TextField(label="Time Limit (seconds)", value="5", width=200)
 
     result_text_control = ft.Text("", size=14)  # Text control to display the solution
     result_dialog = ft.AlertDialog(
@@ -189,34 +267,55 @@ def main(page: ft.Page):
         open=False  # Initially dialog is closed
     )
 
+    # Function to display an error message in an alert dialog
+    def show_error(message):
+        error_dialog = ft.AlertDialog(
+            title=ft.Text("Error"),
+            content=ft.Text(message),
+            actions=[
+                ft.TextButton("Close", on_click=lambda e: (setattr(error_dialog, 'open', False), page.update()))
+            ],
+            open=True
+        )
+        page.dialog = error_dialog
+        page.update()
+
     # Function to handle solve button click event
     def solve_and_display(e):
         try:
             # Parse input values
             num_customers_val, vehicle_capacity_val, customer_demands_val, edges_val = parse_input(
                 num_customers.value, vehicle_capacity.value, customer_demands.value, edges.value)
-            
-            # Solve routing problem and get result text
-            result_text = solve_routing_problem(num_customers_val, vehicle_capacity_val, customer_demands_val, edges_val)
-            
-            # Update result text control and open result dialog
-            result_text_control.value = result_text
-            result_dialog.open = True
-            page.update()
+            time_limit_val = parse_time_limit(time_limit.value)
         
         # Handle invalid input exceptions
         except ValueError as ex:
-            # Display error message in an alert dialog
-            error_dialog = ft.AlertDialog(
-                title=ft.Text("Error"),
-                content=ft.Text(str(ex)),
-                actions=[
-                    ft.TextButton("Close", on_click=lambda e: (setattr(error_dialog, 'open', False), page.update()))
-                ],
-                open=True
-            )
-            page.dialog = error_dialog
-            page.update()
+            show_error(str(ex))
+            return
+
+        # Solve routing problem on a worker thread so the window stays responsive
+        def run_solver():
+            try:
+                result_text = solve_routing_problem(num_customers_val, vehicle_capacity_val, customer_demands_val, edges_val, time_limit_val)
+
+                # Update result text control and open result dialog
+                result_text_control.value = result_text
+                page.dialog = result_dialog
+                result_dialog.open = True
+            except Exception as ex:
+                # Report solver failures instead of losing them with the thread
+                show_error(f"Solver error: {str(ex)}")
+            finally:
+                # Allow the next solve once this one has finished
+                solve_button.text = "Solve"
+                solve_button.disabled = False
+                page.update()
+
+        # Disable the solve button while a solve is running so results cannot arrive out of order
+        solve_button.text = "Solving..."
+        solve_button.disabled = True
+        page.update()
+        threading.Thread(target=run_solver, daemon=True).start()
 
     # Create the solve button and bind it to the solve_and_display function
     solve_button = ft.ElevatedButton(text="Solve", on_click=solve_and_display)
@@ -233,6 +332,7 @@ def main(page: ft.Page):
                     vehicle_capacity,
                     customer_demands,
                     edges,
+                    time_limit,
                     solve_button,
                 ],
                 alignment=ft.MainAxisAlignment.CENTER,